@@ -1,16 +1,282 @@
 #!/usr/bin/env python3
+import atexit
+import codecs
+import functools
+import hashlib
+import io
 import json
+import locale
 import os
+import re
+import selectors
+import sqlite3
 import subprocess
 import sys
-from openai import OpenAI
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from termcolor import colored
 import platform
-import distro
-import tiktoken
-from prompt_toolkit import ANSI, PromptSession, prompt
+from prompt_toolkit import ANSI, PromptSession
 from prompt_toolkit.history import FileHistory
 from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.keys import Keys
+
+try:
+    from blake3 import blake3
+except ImportError:
+    blake3 = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SYSTEM_PROMPT_TEMPLATE = (
+    "You are a command line assistant. Use the get_commands function to propose "
+    "shell commands that accomplish the user's request. Prefer short, "
+    "non-interactive commands and describe what each one does. After the "
+    "commands run you receive their command, stdout and stderr as JSON; explain "
+    "the result and propose follow-up commands only when they are needed.\n"
+    "The user's shell is {shell_name} on {os_name}."
+)
+
+# Lines with an "="; redact_key_assignment decides whether one follows "KEY"
+KEY_ASSIGNMENT_RE = re.compile(r"^([^=\n]*)=[^\n]*", re.MULTILINE)
+
+
+def redact_key_assignment(match):
+    """Keeps a line up to its first "=" when an "=" appears after "KEY" in it."""
+    line = match.group(0)
+    key_index = line.find("KEY")
+    if key_index >= 0 and line.find("=", key_index + 3) >= 0:
+        return match.group(1) + "=<API_KEY>"
+    return line
+
+# ANSI codes for streamed text, taken from termcolor so NO_COLOR and non-tty output still work
+MAGENTA_START, _, COLOR_RESET = colored("\0", "magenta").partition("\0")
+
+# Answers to the run prompt that run the command, and inputs that quit the shell
+RUN_ACTIONS = frozenset({"y", "a"})
+QUIT_COMMANDS = frozenset({"q"})
+
+# Static prompts and messages are colored once instead of on every use
+RUN_PROMPT = ANSI(colored(
+    "Do you want to run (y), edit (e), or execute all (a) commands? (y/e/a/N): ", "green"))
+EDIT_PROMPT = ANSI(colored("Enter the modified command: ", "cyan"))
+CONFIRM_PROMPT = ANSI(colored("Do you want to run the command? (y/N): ", "green"))
+MANUAL_MODE_MSG = colored("Manual command mode activated. Please enter your command:", "green")
+CACHE_CLEARED_MSG = colored("Response cache cleared", "green")
+NO_COMMANDS_MSG = colored("No commands found", "red")
+NOT_ACTIONABLE_MSG = colored("Please describe what you want to do.", "yellow")
+SKIP_MSG = colored("Skipping command", "yellow")
+EXITING_MSG = colored("Exiting...", "yellow")
+
+
+def json_dumps(value):
+    """Serializes a value to a JSON string, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value, ensure_ascii=False)
+
+
+def json_loads(data):
+    """Parses a JSON string, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+@functools.lru_cache(maxsize=1)
+def get_http_client():
+    """Returns the process-wide pooled HTTP/2 client used for OpenAI requests.
+
+    Sharing it keeps the TLS connection alive between the chained get_commands and
+    send_commands_outputs requests, and across OpenAIHelper instances."""
+    import httpx
+
+    # Idle connections are kept for two minutes so they survive the pause while the
+    # user reads the commands and confirms them before the follow-up request.
+    return httpx.Client(
+        http2=True,
+        timeout=httpx.Timeout(600, connect=5),
+        limits=httpx.Limits(max_connections=10, max_keepalive_connections=10,
+                            keepalive_expiry=120))
+
+
+# The tools schema has no per-machine details (those close the system message),
+# so the cacheable request prefix is the same on every machine and every turn.
+GET_COMMANDS_TOOLS = (
+    {
+        "type": "function",
+        "function": {
+            "name": "get_commands",
+            "description": "Get a list of shell commands to run on the user's machine",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "commands": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "command": {
+                                    "type": "string",
+                                    "description": "A valid command string"
+                                },
+                                "description": {
+                                    "type": "string",
+                                    "description": "Description of the command"
+                                }
+                            },
+                            "required": ["command"]
+                        },
+                        "description": "List of terminal command objects to be executed"
+                    },
+                    "response": {
+                        "type": "string",
+                        "description": "Give me a detailed description of what you want to do",
+                    }
+                },
+                "required": ["commands", "response"]
+            }
+        }
+    },
+)
+
+
+class ResponseCache:
+    """An exact-match cache for get_commands results.
+
+    Recent entries are kept in an in-memory LRU in front of the SQLite database,
+    and entries older than ttl seconds are treated as missing."""
+
+    def __init__(self, path, ttl, max_memory_entries=256):
+        """Opens (or creates) the SQLite cache database."""
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.memory = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS cached_commands "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)")
+        self.delete_expired()
+
+    @staticmethod
+    def make_key(*parts):
+        """Returns a 128-bit cache key for the given strings, using BLAKE3 when available."""
+        data = "\x1f".join(parts).encode()
+        if blake3 is not None:
+            return "b3" + blake3(data).hexdigest(length=16)
+        return "b2" + hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    @staticmethod
+    def normalize_prompt(prompt):
+        """Collapses whitespace in a prompt; case and punctuation can be part of a path."""
+        return " ".join(prompt.split())
+
+    def remember(self, key, entry):
+        """Puts a (value, created) entry at the front of the in-memory LRU."""
+        self.memory[key] = entry
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.max_memory_entries:
+            self.memory.popitem(last=False)
+
+    def get(self, key):
+        """Returns the cached value for the key, or None if it is missing or expired."""
+        entry = self.memory.get(key)
+        if entry is None:
+            row = self.connection.execute(
+                "SELECT value, created FROM cached_commands WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            entry = (json_loads(row[0]), row[1])
+        if time.time() - entry[1] > self.ttl:
+            self.memory.pop(key, None)
+            with self.connection:
+                self.connection.execute("DELETE FROM cached_commands WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+        self.remember(key, entry)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, value):
+        """Stores the value under the key."""
+        entry = (value, time.time())
+        self.remember(key, entry)
+        with self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cached_commands (key, value, created) VALUES (?, ?, ?)",
+                (key, json_dumps(value), entry[1]))
+
+    def delete_expired(self):
+        """Removes the entries older than ttl seconds from the database."""
+        with self.connection:
+            self.connection.execute(
+                "DELETE FROM cached_commands WHERE created < ?", (time.time() - self.ttl,))
+
+    def stats(self):
+        """Returns entry counts and this session's hit/miss counts."""
+        stored, = self.connection.execute(
+            "SELECT COUNT(*) FROM cached_commands WHERE created >= ?", (time.time() - self.ttl,)).fetchone()
+        return {"stored": stored, "in_memory": len(self.memory), "hits": self.hits, "misses": self.misses}
+
+    def clear(self):
+        """Removes every cached entry."""
+        self.memory.clear()
+        with self.connection:
+            self.connection.execute("DELETE FROM cached_commands")
+
+
+class RateLimiter:
+    """A token bucket that paces requests under requests- and tokens-per-minute limits.
+
+    A limit of 0 disables that bucket."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        """Starts with both buckets full."""
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.available_requests = requests_per_minute
+        self.available_tokens = tokens_per_minute
+        self.last_refill = time.monotonic()
+        self.enabled = bool(requests_per_minute or tokens_per_minute)
+
+    def refill(self):
+        """Adds the capacity regained since the last refill."""
+        now = time.monotonic()
+        elapsed_minutes = (now - self.last_refill) / 60
+        self.last_refill = now
+        self.available_requests = min(
+            self.requests_per_minute, self.available_requests + elapsed_minutes * self.requests_per_minute)
+        self.available_tokens = min(
+            self.tokens_per_minute, self.available_tokens + elapsed_minutes * self.tokens_per_minute)
+
+    def acquire(self, tokens):
+        """Sleeps until a request using the given number of tokens fits both limits."""
+        # A request larger than the whole bucket only waits for a full bucket
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            self.refill()
+            wait_minutes = 0
+            if self.requests_per_minute and self.available_requests < 1:
+                wait_minutes = (1 - self.available_requests) / self.requests_per_minute
+            if self.tokens_per_minute and self.available_tokens < tokens:
+                wait_minutes = max(wait_minutes, (tokens - self.available_tokens) / self.tokens_per_minute)
+            if wait_minutes <= 0:
+                break
+            time.sleep(wait_minutes * 60)
+        if self.requests_per_minute:
+            self.available_requests -= 1
+        self.available_tokens -= tokens
 
 
 class OpenAIHelper:
@@ -22,55 +288,109 @@ class OpenAIHelper:
         if self.api_key == "":
             print(colored("Error: OPENAI_API_KEY is not set", "red"), file=sys.stderr)
             exit(1)
-        self.client = OpenAI(api_key=self.api_key)
+        from openai import OpenAI
+        self.client = OpenAI(api_key=self.api_key, http_client=get_http_client())
 
         self.max_tokens = max_tokens
         self.remaning_tokens = max_tokens
         self.model_name = model_name
-        self.all_messages = []
+        self.all_messages = deque()
+        self.pending_tool_call_ids = []
+        self.first_prompt = True
         self.set_model_for_encoding(model_name)
         self.os_name, self.shell_name = OSHelper.get_os_and_shell_info()
 
-        self.tools = [
-            {
-                "type": "function",
-                "function": {
-                    "name": "get_commands",
-                    "description": f"Get a list of {self.shell_name} commands on an {self.os_name} machine",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "commands": {
-                                "type": "array",
-                                "items": {
-                                    "type": "object",
-                                    "properties": {
-                                        "command": {
-                                            "type": "string",
-                                            "description": "A valid command string"
-                                        },
-                                        "description": {
-                                            "type": "string",
-                                            "description": "Description of the command"
-                                        }
-                                    },
-                                    "required": ["command"]
-                                },
-                                "description": "List of terminal command objects to be executed"
-                            },
-                            "response": {
-                                "type": "string",
-                                "description": "Give me a detailed description of what you want to do",
-                            }
-                        },
-                        "required": ["commands", "response"]
-                    }
-                }
-            }
-        ]
+        # The system message stays pinned in front of the history and its static
+        # part comes first, so the request prefix is byte-identical on every turn
+        # and OpenAI's automatic prompt caching can reuse it.
+        self.system_message = {
+            "role": "system",
+            "content": SYSTEM_PROMPT_TEMPLATE.format(shell_name=self.shell_name, os_name=self.os_name)
+        }
+        self.system_message_tokens = self.get_message_tokens(self.system_message)
+
+        # The conversation is restored on startup so the cached prompt prefix keeps hitting
+        self.session_path = os.path.expanduser('~') + "/.gpts_session.json"
+        self.load_session()
+        atexit.register(self.save_session)
+
+        self.tools = GET_COMMANDS_TOOLS
+        self.get_commands_tool_choice = {"type": "function", "function": {"name": "get_commands"}}
+        self.tools_json = json_dumps(self.tools)
+        # Routes requests that share the system message and tools to the same prompt cache
+        self.prompt_cache_key = ResponseCache.make_key(self.system_message["content"], self.tools_json)
+        self.cache = ResponseCache(os.path.expanduser('~') + "/.gpts_cache.sqlite",
+                                   ttl=self.get_env_number("GPT_SHELL_CACHE_TTL", 86400))
+        self.rate_limiter = RateLimiter(self.get_env_number("GPT_SHELL_RPM", 0),
+                                        self.get_env_number("GPT_SHELL_TPM", 0))
+
+    @staticmethod
+    def get_env_number(name, default):
+        """Returns a numeric setting from the environment, or the default."""
+        try:
+            return float(os.getenv(name, default))
+        except ValueError:
+            print(colored(f"Warning: {name} is not a number. Using {default}.", "yellow"), file=sys.stderr)
+            return default
+
+    def get_session_key(self):
+        """Returns a hash identifying the model and system message a session belongs to."""
+        return ResponseCache.make_key(self.model_name, self.system_message["content"])
+
+    def load_session(self):
+        """Restores the conversation saved by a previous run with the same system message."""
+        try:
+            with open(self.session_path, encoding="utf-8") as file:
+                session = json_loads(file.read())
+        except (OSError, ValueError):
+            return
+        if not isinstance(session, dict) or session.get("key") != self.get_session_key():
+            return
+        messages = session.get("messages")
+        pending_tool_call_ids = session.get("pending_tool_call_ids")
+        # A file that does not hold a well-formed conversation is ignored
+        if not isinstance(messages, list) or not all(
+                isinstance(message, dict) and isinstance(message.get("role"), str)
+                for message in messages):
+            return
+        if not isinstance(pending_tool_call_ids, list) or not all(
+                isinstance(tool_call_id, str) for tool_call_id in pending_tool_call_ids):
+            return
+        self.all_messages = deque(messages)
+        self.pending_tool_call_ids = pending_tool_call_ids
+        try:
+            self.truncate_chat_message()
+        except (AttributeError, KeyError, TypeError):
+            self.all_messages = deque()
+            self.pending_tool_call_ids = []
+
+    def save_session(self):
+        """Saves the conversation so the next run can continue it.
+
+        The file holds command outputs, so it is private to the user, and it is
+        written to a temporary file first so a crash never leaves it truncated."""
+        session = {
+            "key": self.get_session_key(),
+            "messages": list(self.all_messages),
+            "pending_tool_call_ids": self.pending_tool_call_ids
+        }
+        temp_path = None
+        try:
+            data = json_dumps(session)
+            fd, temp_path = tempfile.mkstemp(prefix=".gpts_session.",
+                                             dir=os.path.dirname(self.session_path))
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                file.write(data)
+            os.replace(temp_path, self.session_path)
+        except (OSError, TypeError) as e:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+            print(colored(f"Warning: Could not save the session: {e}", "yellow"), file=sys.stderr)
 
     def set_model_for_encoding(self, model: str):
         """Configures encoding settings and token counts for a given model."""
+        import tiktoken
+
         try:
             # Token settings for known models
             if model in {
@@ -110,28 +430,31 @@ class OpenAIHelper:
             print(colored(f"Warning: Model {model} not found. Using 'cl100k_base' encoding.", "yellow"))
             self.encoding = tiktoken.get_encoding("cl100k_base")
 
+    def get_message_tokens(self, message):
+        """Returns the number of tokens used by a single message."""
+        num_tokens = self.tokens_per_message
+        for key, value in message.items():
+            if key == "name":
+                num_tokens += self.tokens_per_name
+            if value is None:
+                continue
+            if isinstance(value, dict):
+                for k, v in value.items():
+                    if isinstance(v, str):
+                        num_tokens += len(self.encoding.encode(v))
+                continue
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, str):  # Encode each string item in the list
+                        num_tokens += len(self.encoding.encode(item))
+            elif isinstance(value, str):  # Encode only if it's a string
+                num_tokens += len(self.encoding.encode(value))
+        return num_tokens
+
     def get_all_message_tokens(self):
         """Returns the number of tokens used by a list of messages."""
-        num_tokens = 0
-        for message in self.all_messages:
-            num_tokens += self.tokens_per_message
-            for key, value in message.items():
-                if key == "name":
-                    num_tokens += self.tokens_per_name
-                if value is None:
-                    continue
-                if isinstance(value, dict):
-                    for k, v in value.items():
-                        if isinstance(v, str):
-                            num_tokens += len(self.encoding.encode(v))
-                    continue
-                if isinstance(value, list):
-                    for item in value:
-                        if isinstance(item, str):  # Encode each string item in the list
-                            num_tokens += len(self.encoding.encode(item))
-                elif isinstance(value, str):  # Encode only if it's a string
-                    num_tokens += len(self.encoding.encode(value))
-
+        num_tokens = self.system_message_tokens
+        num_tokens += sum(self.get_message_tokens(message) for message in self.all_messages)
         num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
         return num_tokens
 
@@ -193,34 +516,89 @@ class OpenAIHelper:
 
         return outputs
 
+    def truncate_prompt(self, prompt):
+        """Truncates the prompt so that it fits in half of the max_tokens limit."""
+        max_tokens = self.max_tokens // 2
+        tokens = self.encoding.encode(prompt)
+        if len(tokens) <= max_tokens:
+            return prompt
+        return self.encoding.decode(tokens[:max_tokens])
+
     def truncate_chat_message(self):
-        """Truncates the chat message list so that the total tokens fit the max_tokens limit."""
+        """Truncates the chat message list so that the total tokens fit the max_tokens limit.
+
+        Returns the token count of the remaining conversation."""
         max_tokens = self.max_tokens - 400
         all_message_tokens = self.get_all_message_tokens()
 
-        while all_message_tokens > max_tokens:
+        # Subtract the popped message instead of re-encoding the whole history.
+        # Tool responses left without their assistant tool_calls message are dropped too.
+        while all_message_tokens > max_tokens or (
+                self.all_messages and self.all_messages[0]["role"] == "tool"):
             try:
-                message = self.all_messages.pop(0)
-                all_message_tokens = self.get_all_message_tokens()
+                message = self.all_messages.popleft()
             except IndexError:
                 break
-            pass
+            all_message_tokens -= self.get_message_tokens(message)
+        return all_message_tokens
+
+    def answer_pending_tool_calls(self, content):
+        """Adds the tool responses the API expects after an assistant tool_calls message."""
+        for tool_call_id in self.pending_tool_call_ids:
+            self.all_messages.append({
+                "role": "tool",
+                "content": content,
+                "tool_call_id": tool_call_id
+            })
+            content = ""
+        self.pending_tool_call_ids = []
 
     def get_commands(self, prompt):
         """Returns a list of commands to be executed."""
+        self.answer_pending_tool_calls("No commands were run.")
+        prompt = self.truncate_prompt(prompt)
+
         message = {
             "role": "user",
             "content": prompt
         }
         self.all_messages.append(message)
 
-        self.truncate_chat_message()
+        # Only the first prompt of a run is cached: later ones can refer to the
+        # conversation ("do it again"), which a cached answer would ignore. The system
+        # message carries the OS and shell the answer was generated for.
+        cache_key = None
+        commands = None
+        if self.first_prompt:
+            self.first_prompt = False
+            cache_key = ResponseCache.make_key(
+                self.model_name, self.system_message["content"], self.tools_json,
+                ResponseCache.normalize_prompt(prompt))
+            commands = self.cache.get(cache_key)
+        if commands is not None:
+            self.pending_tool_call_ids = [f"call_{cache_key}"]
+            self.all_messages.append({
+                "role": "assistant",
+                "content": None,
+                "tool_calls": [{
+                    "id": self.pending_tool_call_ids[0],
+                    "type": "function",
+                    "function": {"name": "get_commands", "arguments": json_dumps(commands)}
+                }]
+            })
+            self.truncate_chat_message()
+            return commands
+
+        all_message_tokens = self.truncate_chat_message()
+        if self.rate_limiter.enabled:
+            self.rate_limiter.acquire(all_message_tokens)
 
         response = self.client.chat.completions.create(
             model=self.model_name,
-            messages=self.all_messages,
+            messages=[self.system_message, *self.all_messages],
             tools=self.tools,
-            tool_choice={"type": "function", "function": {"name": "get_commands"}},
+            tool_choice=self.get_commands_tool_choice,
+            extra_body={"prompt_cache_key": self.prompt_cache_key},
         )
 
         commands = None
@@ -228,29 +606,22 @@ class OpenAIHelper:
             response_message = response.choices[0].message
             if response_message.tool_calls:
                 for tool_call in response_message.tool_calls:
-                    function_call = tool_call.function
-                    tool_call_id = tool_call.id
-
-                    # Append a tool response for each tool_call
-                    tool_response = {
-                        "role": "function",
-                        "name": function_call.name,
-                        "content": f"Tool response for {tool_call_id}",
-                    }
-                    self.all_messages.append(tool_response)
-
-                    commands = json.loads(function_call.arguments)
+                    commands = json_loads(tool_call.function.arguments)
 
+                # The tool calls are answered with the command outputs in send_commands_outputs
                 message = {
                     "role": "assistant",
                     "content": None,
-                    "tool_calls": response_message.tool_calls
+                    "tool_calls": [tool_call.model_dump() for tool_call in response_message.tool_calls]
                 }
                 self.all_messages.append(message)
+                self.pending_tool_call_ids = [tool_call.id for tool_call in response_message.tool_calls]
         except Exception as e:
             print(colored(f"Error: {e}", "red"), file=sys.stderr)
             return None
 
+        if cache_key is not None and commands is not None and "commands" in commands:
+            self.cache.set(cache_key, commands)
         return commands
 
     def send_commands_outputs(self, outputs):
@@ -258,15 +629,13 @@ class OpenAIHelper:
         # Truncate outputs to fit within the token limit
         outputs = self.truncate_outputs(outputs)
 
-        # Create a tool response message
-        outputs_json = json.dumps(outputs)
-        tool_response_message = {
-            "role": "tool",
-            "content": outputs_json,
-            "tool_call_id": self.last_tool_call_id if hasattr(self, 'last_tool_call_id') else None
-        }
-        if hasattr(self, 'last_tool_call_id'):
-            self.all_messages.append(tool_response_message)
+        # All outputs of the batch go back in a single follow-up request
+        outputs_json = json_dumps(outputs)
+        if self.pending_tool_call_ids:
+            self.answer_pending_tool_calls(outputs_json)
+        else:
+            # Manually entered commands have no tool call to answer
+            self.all_messages.append({"role": "user", "content": outputs_json})
 
         # Add a user prompt for detailed explanation
         prompt_message = {
@@ -276,89 +645,169 @@ class OpenAIHelper:
         self.all_messages.append(prompt_message)
 
         # Truncate chat messages to fit token limits
-        self.truncate_chat_message()
+        all_message_tokens = self.truncate_chat_message()
+        if self.rate_limiter.enabled:
+            self.rate_limiter.acquire(all_message_tokens)
 
         try:
-            # Send the updated conversation to the OpenAI API
-            response = self.client.chat.completions.create(
+            # Send the updated conversation to the OpenAI API, printing text as it streams in
+            response_content, tool_calls = self.stream_chat_completion(
                 model=self.model_name,
-                messages=self.all_messages,
+                messages=[self.system_message, *self.all_messages],
                 tools=self.tools,
                 tool_choice='auto',
+                extra_body={"prompt_cache_key": self.prompt_cache_key},
             )
 
             # Parse the response
-            response_content = None
             commands = None
-            response_message = response.choices[0].message
-            
+
             # Add the assistant's response to messages
             assistant_message = {
                 "role": "assistant",
-                "content": response_message.content if response_message.content else None,
+                "content": response_content,
             }
-            
-            if response_message.tool_calls:
-                assistant_message["tool_calls"] = [tool_call.model_dump() for tool_call in response_message.tool_calls]
-                
-                # Handle tool calls and add tool response messages immediately
-                for tool_call in response_message.tool_calls:
-                    self.last_tool_call_id = tool_call.id
-                    tool_response = None
-                    
-                    if tool_call.function.name == "get_commands":
-                        commands = json.loads(tool_call.function.arguments)
-                        tool_response = json.dumps(commands)
-                    else:
-                        # For any unknown tool calls, respond with empty result
-                        tool_response = ""
-                        
-                    # Add a tool response message for each tool call
-                    self.all_messages.append({
-                        "role": "tool",
-                        "content": tool_response,
-                        "tool_call_id": tool_call.id,
-                        "name": tool_call.function.name
-                    })
-            
+
+            if tool_calls:
+                assistant_message["tool_calls"] = tool_calls
+                for tool_call in tool_calls:
+                    if tool_call["function"]["name"] == "get_commands":
+                        commands = json_loads(tool_call["function"]["arguments"]).get("commands")
+
             self.all_messages.append(assistant_message)
-            response_content = response_message.content
+            # Follow-up commands are answered with their outputs on the next call
+            self.pending_tool_call_ids = [tool_call["id"] for tool_call in tool_calls]
             return response_content, commands
         except Exception as e:
             print(colored(f"Error: {e}", "red"), file=sys.stderr)
-            return None
+            return None, None
+
+    def stream_chat_completion(self, **kwargs):
+        """Streams a chat completion, printing text deltas as they arrive.
+
+        Returns the full response text and the tool calls assembled from the deltas."""
+        content = []
+        tool_calls = {}
+        try:
+            for chunk in self.client.chat.completions.create(stream=True, **kwargs):
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                if delta.content:
+                    # Color codes are written once around the whole text, not per chunk
+                    print(delta.content if content else MAGENTA_START + delta.content, end="", flush=True)
+                    content.append(delta.content)
+                for tool_call_delta in delta.tool_calls or []:
+                    tool_call = tool_calls.setdefault(tool_call_delta.index, {
+                        "id": None,
+                        "type": "function",
+                        "function": {"name": "", "arguments": ""}
+                    })
+                    if tool_call_delta.id:
+                        tool_call["id"] = tool_call_delta.id
+                    if tool_call_delta.function:
+                        tool_call["function"]["name"] += tool_call_delta.function.name or ""
+                        tool_call["function"]["arguments"] += tool_call_delta.function.arguments or ""
+        finally:
+            if content:
+                print(COLOR_RESET)
+        return "".join(content) or None, [tool_calls[index] for index in sorted(tool_calls)]
 
 
 class CommandHelper:
     """Helper class for executing commands."""
 
+    # System probes whose output can't change while the shell is running
+    STATIC_COMMANDS = frozenset({
+        "uname", "uname -a", "uname -s", "uname -r", "uname -m", "arch",
+        "lsb_release -a", "cat /etc/os-release",
+    })
+    _static_outputs = {}
+
     @staticmethod
-    def run_shell_command(command):
-        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE, text=True, universal_newlines=True)
-        stdout = []
+    def _text_decoder():
+        """Returns an incremental decoder matching subprocess text mode."""
+        decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors="replace")
+        return io.IncrementalNewlineDecoder(decoder, translate=True)
 
-        for line in process.stdout:
-            print(line, end="")
-            stdout.append(line)
+    @staticmethod
+    def _drain_pipe(pipe, decoder, chunks, echo):
+        """Reads a pipe to EOF in 64 KiB chunks, decoding and optionally echoing them."""
+        while True:
+            data = os.read(pipe.fileno(), 65536)
+            text = decoder.decode(data, final=not data)
+            if echo and text:
+                print(text, end="", flush=True)
+            chunks.append(text)
+            if not data:
+                return
 
-        stderr_data = process.stderr.read()
-        if stderr_data:
-            print(colored(f"Error\n{stderr_data}", "red"))
+    @staticmethod
+    def run_shell_command(command, echo=True):
+        """Runs a shell command, reusing earlier output of static system probes.
+
+        With echo=False nothing is printed, so commands can run concurrently."""
+        key = command.strip()
+        if key in CommandHelper.STATIC_COMMANDS:
+            output = CommandHelper._static_outputs.get(key)
+            if output is None:
+                output = CommandHelper._run_shell_command(command, echo)
+                if not output["stderr"]:
+                    CommandHelper._static_outputs[key] = output
+            elif echo:
+                print(output["stdout"], end="")
+            return dict(output, command=command)
+        return CommandHelper._run_shell_command(command, echo)
 
-        process.wait()
+    @staticmethod
+    def _run_shell_command(command, echo):
+        # shell=True already execs an absolute /bin/sh; with close_fds=False and no
+        # preexec hooks CPython can use posix_spawn instead of fork+exec. Our own
+        # descriptors are non-inheritable by default, so nothing extra leaks.
+        with subprocess.Popen(command, shell=True, close_fds=False, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE) as process:
+            decoders = {
+                process.stdout: CommandHelper._text_decoder(),
+                process.stderr: CommandHelper._text_decoder(),
+            }
+            chunks = {process.stdout: [], process.stderr: []}
+
+            if os.name == "nt":
+                # select() only accepts sockets on Windows, so stderr is drained on a
+                # thread while stdout is read here.
+                stderr_reader = threading.Thread(target=CommandHelper._drain_pipe, args=(
+                    process.stderr, decoders[process.stderr], chunks[process.stderr], False))
+                stderr_reader.start()
+                CommandHelper._drain_pipe(process.stdout, decoders[process.stdout],
+                                          chunks[process.stdout], echo)
+                stderr_reader.join()
+            else:
+                # Read whatever is ready on either pipe in 64 KiB chunks, so a chatty
+                # stderr can't stall stdout and text is decoded in bulk, not per line.
+                with selectors.DefaultSelector() as selector:
+                    for pipe in decoders:
+                        selector.register(pipe, selectors.EVENT_READ)
+                    while selector.get_map():
+                        for key, _ in selector.select():
+                            data = os.read(key.fd, 65536)
+                            text = decoders[key.fileobj].decode(data, final=not data)
+                            if not data:
+                                selector.unregister(key.fileobj)
+                            if echo and key.fileobj is process.stdout and text:
+                                print(text, end="", flush=True)
+                            chunks[key.fileobj].append(text)
+
+            stdout = chunks[process.stdout]
+            stderr_data = ''.join(chunks[process.stderr])
+
+        if echo and stderr_data:
+            print(colored(f"Error\n{stderr_data}", "red"))
 
         output = {"command": command, "stdout": ''.join(
             stdout), "stderr": stderr_data}
 
-        if output["stdout"] != "":
-            stdout_lines = output["stdout"].split("\n")
-            for i, line in enumerate(stdout_lines):
-                if "KEY" in line:
-                    post_key_content = line[line.find("KEY") + 3:].strip()
-                    if "=" in post_key_content:
-                        stdout_lines[i] = line.split("=")[0] + "=<API_KEY>"
-            output["stdout"] = "\n".join(stdout_lines)
+        if output["stdout"] and "KEY" in output["stdout"]:
+            output["stdout"] = KEY_ASSIGNMENT_RE.sub(redact_key_assignment, output["stdout"])
         return output
 
 
@@ -366,11 +815,13 @@ class OSHelper:
     """Helper class for getting OS and shell information."""
 
     @staticmethod
+    @functools.lru_cache(maxsize=1)
     def get_os_and_shell_info():
-        """Returns the OS and shell information."""
+        """Returns the OS and shell information, computed once per process."""
         os_name = platform.system()
         shell_name = os.path.basename(os.environ.get("SHELL", ""))
         if os_name == "Linux":
+            import distro
             os_name += f" {distro.name()}"
         elif os_name == "Darwin":
             os_name += f" {platform.mac_ver()[0]}"
@@ -389,33 +840,61 @@ class Application:
         self.session = PromptSession(history=FileHistory(os.path.expanduser(
             '~') + "/.gpts_history"), auto_suggest=AutoSuggestFromHistory())
 
+        # Inputs handled locally instead of being sent to the model
+        self.runtime_commands = {
+            "e": self.manual_command_mode,
+            "cache clear": self.clear_cache,
+            "cache stats": self.show_cache_stats,
+        }
+
+        # Opt-in: after "execute all", run the remaining commands of a batch concurrently
+        self.parallel_exec = os.getenv("GPT_SHELL_PARALLEL_EXEC", "0") == "1"
+
     def interpret_and_execute_command(self, user_prompt):
         """Interprets and executes the command."""
-        if user_prompt == "e":
-            self.manual_command_mode()
+        handler = self.runtime_commands.get(user_prompt.strip().lower())
+        if handler is not None:
+            handler()
         else:
             self.auto_command_mode(user_prompt)
 
+    def clear_cache(self):
+        """Drops every cached get_commands answer."""
+        self.openai_helper.cache.clear()
+        print(CACHE_CLEARED_MSG)
+
     def manual_command_mode(self):
         """Manual command mode."""
-        print(colored("Manual command mode activated. Please enter your command:", "green"))
+        print(MANUAL_MODE_MSG)
         command_str = self.session.prompt("")
         command_output = self.command_helper.run_shell_command(command_str)
         outputs = [command_output]
 
-        response, commands = self.openai_helper.send_commands_outputs(outputs)
-        print(colored(f"{response}", "magenta"))
+        _, commands = self.openai_helper.send_commands_outputs(outputs)
 
         if commands is not None:
             self.execute_commands(commands)
 
+    def show_cache_stats(self):
+        """Prints response cache statistics."""
+        stats = self.openai_helper.cache.stats()
+        print(colored(
+            f"Cached answers: {stats['stored']} stored, {stats['in_memory']} in memory; "
+            f"this session: {stats['hits']} hits, {stats['misses']} misses", "green"))
+
     def auto_command_mode(self, user_prompt):
         """Auto command mode."""
+        # Empty, single-character or punctuation-only input is not worth an API call
+        stripped_prompt = user_prompt.strip()
+        if len(stripped_prompt) < 2 or not any(char.isalnum() for char in stripped_prompt):
+            print(NOT_ACTIONABLE_MSG)
+            return
+
         commands = self.openai_helper.get_commands(user_prompt)
         if commands is not None:
             self.execute_commands(commands["commands"])
         else:
-            print(colored("No commands found", "red"))
+            print(NO_COMMANDS_MSG)
 
     def execute_commands(self, commands):
         """Executes the commands."""
@@ -424,49 +903,87 @@ class Application:
         while commands is not None:
             commands_list = [command["command"] for command in commands]
             print(colored(f"List of commands {commands_list}", "magenta"))
-            for command in commands:
+            for index, command in enumerate(commands):
+                if action.lower() == "a" and self.parallel_exec:
+                    outputs.extend(self.run_commands_in_parallel(
+                        [remaining["command"] for remaining in commands[index:]]))
+                    break
+
                 command_str = command["command"]
-                print(colored(f"{command['description']}", "magenta"))
+                print(colored(f"{command.get('description', '')}", "magenta"))
                 print(colored(f"{command_str}", "blue"))
 
                 if action.lower() != "a":
-                    action = prompt(ANSI(
-                        colored(f"Do you want to run (y), edit (e), or execute all (a) commands? (y/e/a/N): ", "green")))
+                    action = self.prompt_key(RUN_PROMPT)
 
                 if action.lower() == "e":
-                    command_str = self.session.prompt(ANSI(
-                        colored("Enter the modified command: ", "cyan")), default=command_str)
-                    action = prompt(ANSI(
-                        colored(f"Do you want to run the command? (y/N): ", "green")))
+                    command_str = self.session.prompt(EDIT_PROMPT, default=command_str)
+                    action = self.prompt_key(CONFIRM_PROMPT)
 
-                if action.lower() in ["y", "a"]:
+                if action.lower() in RUN_ACTIONS:
                     output = self.command_helper.run_shell_command(command_str)
                     outputs.append(output)
                 else:
-                    print(colored("Skipping command", "yellow"))
+                    print(SKIP_MSG)
 
             if len(outputs) > 0:
-                response, commands = self.openai_helper.send_commands_outputs(
+                _, commands = self.openai_helper.send_commands_outputs(
                     outputs)
-                print(colored(f"{response}", "magenta"))
                 outputs = []
                 action = ""
             else:
                 commands = None
 
+    def run_commands_in_parallel(self, command_strs):
+        """Runs the commands concurrently and prints their outputs in order."""
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            outputs = list(executor.map(
+                functools.partial(self.command_helper.run_shell_command, echo=False), command_strs))
+        for output in outputs:
+            print(colored(f"{output['command']}", "blue"))
+            print(output["stdout"], end="")
+            if output["stderr"]:
+                print(colored(f"Error\n{output['stderr']}", "red"))
+        return outputs
+
+    @staticmethod
+    def prompt_key(message):
+        """Returns the lower-cased key pressed at the prompt, without waiting for Enter.
+
+        Enter alone returns an empty string, i.e. the default answer."""
+        bindings = KeyBindings()
+
+        @bindings.add(Keys.Any)
+        def _(event):
+            if len(event.data) == 1 and event.data.isprintable():
+                session.default_buffer.text = event.data
+                event.app.exit(result=event.data.lower())
+
+        session = PromptSession(message, key_bindings=bindings)
+        return session.prompt()
+
+    def read_user_input(self):
+        """Reads a prompt, joining lines that end with a backslash into one request."""
+        lines = [self.session.prompt(
+            ANSI(colored(f"ChatGPT ({self.openai_helper.remaning_tokens}): ", "green")))]
+        while lines[-1].endswith("\\"):
+            lines[-1] = lines[-1][:-1]
+            lines.append(self.session.prompt("... "))
+        return "\n".join(lines)
+
     def run(self):
         """Runs the application."""
-        os_name, shell_name = OSHelper.get_os_and_shell_info()
-        print(
-            colored(f"Your current environment: Shell={shell_name}, OS={os_name}", "green"))
         print(colored(
-            "Type 'e' to enter manual command mode or 'q' to quit, (tokens left)\n", "green"))
+            f"Your current environment: Shell={self.openai_helper.shell_name}, OS={self.openai_helper.os_name}",
+            "green"))
+        print(colored(
+            "Type 'e' to enter manual command mode, 'cache stats' or 'cache clear' to inspect or drop cached answers or 'q' to quit, (tokens left)\n"
+            "End a line with '\\' to add more requests to the same prompt\n", "green"))
 
         while True:
             try:
-                user_input = self.session.prompt(
-                    ANSI(colored(f"ChatGPT ({self.openai_helper.remaning_tokens}): ", "green")))
-                if user_input.lower() == 'q':
+                user_input = self.read_user_input()
+                if user_input.lower() in QUIT_COMMANDS:
                     break
                 self.interpret_and_execute_command(user_input)
             except subprocess.CalledProcessError as e:
@@ -479,7 +996,7 @@ class Application:
             except Exception as e:
                 print(
                     colored(f"Error of type {type(e).__name__}: {e}", "red"), file=sys.stderr)
-                print(colored("Exiting...", "yellow"))
+                print(EXITING_MSG)
 
 
 if __name__ == "__main__":